@@ -1,26 +1,510 @@
-from fastapi import FastAPI, HTTPException, Query
-from typing import Optional
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from functools import lru_cache, partial
+from typing import Dict, List, Optional, Tuple, Union
+from xml.etree.ElementTree import ParseError
+
+import orjson
+from cachetools import TTLCache
+from defusedxml.common import DefusedXmlException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
 import uvicorn
 
-from youtube_transcript_api import YouTubeTranscriptApi, NoTranscriptFound, TranscriptsDisabled
-from youtube_transcript_api.formatters import TextFormatter, SRTFormatter, WebVTTFormatter
+from youtube_transcript_api import (
+    YouTubeTranscriptApi,
+    NoTranscriptFound,
+    PoTokenRequired,
+    TranscriptsDisabled,
+)
+# private, see requirements.txt for the versions they are known to exist in
+from youtube_transcript_api._transcripts import _TranscriptParser, _raise_http_errors
+
+log = logging.getLogger("ytt")
+
+# The transcript library is blocking (requests), so its calls are offloaded to a
+# dedicated pool, sized for network-bound work rather than FastAPI's default. Like
+# PARSE_POOL below, it is created by the app's lifespan.
+MAX_WORKERS = 64
+EXECUTOR: Optional[ThreadPoolExecutor] = None
+
+# One shared session keeps connections to youtube.com alive across requests. The
+# pool is as large as the executor, so every worker thread can hold a connection.
+SESSION = Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=MAX_WORKERS,
+        pool_maxsize=MAX_WORKERS,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.2,
+            status_forcelist=[429, 500, 502, 503, 504],
+            # hand the last response to the library, so it raises its own errors
+            raise_on_status=False,
+        ),
+    ),
+)
+ytt_api = YouTubeTranscriptApi(http_client=SESSION)
+
+# uvicorn worker processes, see the __main__ block
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 2))
+
+# Transcripts are downloaded on EXECUTOR, but their XML is parsed in worker
+# processes, so long transcripts are parsed in parallel instead of contending for
+# the GIL. Every uvicorn worker has its own pool, so the CPUs are split between
+# them. Workers are spawned rather than forked, as this process already runs threads.
+PARSE_WORKERS = int(
+    os.environ.get("PARSE_WORKERS", max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY))
+)
+PARSE_POOL: Optional[ProcessPoolExecutor] = None
+
+def _new_parse_pool():
+    return ProcessPoolExecutor(
+        max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+
+CACHE_TTL = 3600
+
+# Optional cache shared by all workers/containers, enabled by setting REDIS_URL.
+REDIS_URL = os.environ.get("REDIS_URL")
+redis_client: Optional[Redis] = None
+
+class ORJSONResponse(JSONResponse):
+    """Encodes responses with orjson, which is much faster on large snippet lists."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the executors are created here rather than at import time, so a shut down
+    # executor from an earlier lifespan (e.g. another test client) is never reused
+    global EXECUTOR, PARSE_POOL, redis_client
+    EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    PARSE_POOL = _new_parse_pool()
+    if REDIS_URL:
+        redis_client = Redis.from_url(REDIS_URL)
+    refresher = asyncio.create_task(_refresh_hot_transcripts())
+    yield
+    refresher.cancel()
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
+    EXECUTOR.shutdown(wait=False)
+    PARSE_POOL.shutdown(wait=False, cancel_futures=True)
 
 app = FastAPI(
     title="YouTube Transcript API",
     description="API for extracting transcripts from YouTube videos",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
+# transcripts are repetitive text and compress very well
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+async def run_blocking(func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(
+        EXECUTOR, partial(func, *args, **kwargs)
+    )
+
+async def run_in_parse_pool(func, *args):
+    global PARSE_POOL
+    pool = PARSE_POOL
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. it was OOM killed), which breaks the whole pool. It is
+        # replaced once, by whichever call sees it first, and the call is retried.
+        if PARSE_POOL is pool:
+            log.warning("Parse pool is broken, starting a new one")
+            PARSE_POOL = _new_parse_pool()
+            pool.shutdown(wait=False)
+        return await asyncio.get_running_loop().run_in_executor(PARSE_POOL, func, *args)
+
+# Published transcripts don't change, so the fetched transcript is cached per request
+# shape, as the plain dict of a FetchedTranscript (snippets plus the language that
+# was picked). All output formats are rendered from the same entry. The cache is only
+# touched from the event loop, so it needs no locking.
+TRANSCRIPT_CACHE = TTLCache(maxsize=2000, ttl=CACHE_TTL)
+# Entries by the transcript they hold, see _load(). They are mostly the same dicts as
+# in TRANSCRIPT_CACHE, so the separate cache only costs the keys, while keeping both
+# kinds of entries from evicting each other.
+RESOLVED_CACHE = TTLCache(maxsize=2000, ttl=CACHE_TTL)
+
+def _find_transcript(video_id, languages, translate_to):
+    transcript = ytt_api.list(video_id).find_transcript(languages)
+    resolved = (transcript.language_code, transcript.is_generated)
+    if translate_to:
+        transcript = transcript.translate(translate_to)
+    return transcript, resolved
+
+def _download_transcript_xml(transcript):
+    """The download half of Transcript.fetch(), run on EXECUTOR."""
+    if "&exp=xpe" in transcript._url:
+        raise PoTokenRequired(transcript.video_id)
+    response = SESSION.get(transcript._url)
+    return _raise_http_errors(response, transcript.video_id).text
+
+def _parse_transcript_xml(raw_xml, preserve_formatting):
+    """The parsing half of Transcript.fetch(), run in a PARSE_POOL process."""
+    try:
+        snippets = _TranscriptParser(preserve_formatting=preserve_formatting).parse(
+            raw_xml
+        )
+    except DefusedXmlException as e:
+        # these can't be unpickled in the parent process
+        raise ValueError(f"Transcript XML rejected: {e}") from None
+    return [asdict(snippet) for snippet in snippets]
+
+FETCH_ATTEMPTS = 3
+
+async def _fetch_transcript(transcript, preserve_formatting):
+    # YouTube occasionally answers with an empty or truncated body, which is worth
+    # another try before giving up
+    for attempt in range(FETCH_ATTEMPTS):
+        raw_xml = await run_blocking(_download_transcript_xml, transcript)
+        try:
+            snippets = await run_in_parse_pool(
+                _parse_transcript_xml, raw_xml, preserve_formatting
+            )
+            break
+        except ParseError:
+            if attempt == FETCH_ATTEMPTS - 1:
+                raise
+    return {
+        "snippets": snippets,
+        "video_id": transcript.video_id,
+        "language": transcript.language,
+        "language_code": transcript.language_code,
+        "is_generated": transcript.is_generated,
+    }
+
+def _redis_key(key):
+    parts = []
+    for part in key:
+        if isinstance(part, tuple):
+            part = ",".join(part)
+        elif part is None:
+            part = ""
+        elif isinstance(part, bool):
+            part = int(part)
+        parts.append(str(part))
+    return "ytt:" + ":".join(parts)
+
+async def _redis_get(key, min_ttl=None):
+    """With `min_ttl`, copies that expire within that many seconds count as missing."""
+    if redis_client is None:
+        return None
+    redis_key = _redis_key(key)
+    try:
+        if min_ttl is not None and await redis_client.ttl(redis_key) <= min_ttl:
+            return None
+        cached = await redis_client.get(redis_key)
+    except RedisError as e:
+        # Redis is only a cache, an outage must not take the API down with it
+        log.warning("Redis get failed for %s: %s", key, e)
+        return None
+    return orjson.loads(cached) if cached is not None else None
+
+async def _redis_set(key, fetched):
+    if redis_client is None:
+        return
+    try:
+        await redis_client.set(_redis_key(key), orjson.dumps(fetched), ex=CACHE_TTL)
+    except RedisError as e:
+        log.warning("Redis set failed for %s: %s", key, e)
+
+async def _resolved_get(resolved_key):
+    fetched = RESOLVED_CACHE.get(resolved_key)
+    if fetched is None:
+        fetched = await _redis_get(resolved_key)
+        if fetched is not None:
+            RESOLVED_CACHE[resolved_key] = fetched
+    return fetched
+
+async def _resolved_set(resolved_key, fetched):
+    RESOLVED_CACHE[resolved_key] = fetched
+    await _redis_set(resolved_key, fetched)
+
+# Loads currently running per request key, and fetches per resolved key. Concurrent
+# requests for the same transcript all await the same task instead of each going to
+# YouTube.
+INFLIGHT: Dict[Tuple, asyncio.Task] = {}
+
+def _single_flight(key, load):
+    task = INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.create_task(load())
+        INFLIGHT[key] = task
+        task.add_done_callback(lambda _: INFLIGHT.pop(key, None))
+    return task
+
+# When the in-process cache entry of each request key expires
+CACHE_EXPIRES: Dict[Tuple, float] = {}
+
+async def _load(key, refresh=False):
+    """Loads the transcript for a request key, which is cached under two keys.
+
+    The request key keeps the requested language priority, as find_transcript
+    depends on it. The resolved key names the transcript that was actually picked,
+    so requests with different priorities that end up at the same transcript only
+    cost a list() call instead of another fetch, and share it if they run at the
+    same time.
+
+    With `refresh`, the in-process copies are ignored, and so are copies in Redis
+    that are about to expire too. Fresher ones were refreshed by another worker,
+    which saves every worker going to YouTube for the same hot transcripts.
+    """
+    min_ttl = REFRESH_AHEAD if refresh else None
+    fetched = await _redis_get(key, min_ttl)
+    if fetched is None:
+        video_id, languages, translate_to, preserve_formatting = key
+        transcript, (language_code, is_generated) = await run_blocking(
+            _find_transcript, video_id, languages, translate_to
+        )
+        resolved_key = (
+            video_id, "=" + language_code, is_generated, translate_to, preserve_formatting
+        )
+        if refresh:
+            fetched = await _redis_get(resolved_key, min_ttl)
+        else:
+            fetched = await _resolved_get(resolved_key)
+        if fetched is None:
+            fetch = partial(_fetch_resolved, resolved_key, transcript, preserve_formatting)
+            fetched = await asyncio.shield(_single_flight(resolved_key, fetch))
+        await _redis_set(key, fetched)
+    TRANSCRIPT_CACHE[key] = fetched
+    CACHE_EXPIRES[key] = TRANSCRIPT_CACHE.timer() + CACHE_TTL
+    return fetched
+
+async def _fetch_resolved(resolved_key, transcript, preserve_formatting):
+    fetched = await _fetch_transcript(transcript, preserve_formatting)
+    await _resolved_set(resolved_key, fetched)
+    return fetched
+
+def _start_load(key, refresh=False):
+    return _single_flight(key, partial(_load, key, refresh=refresh))
+
+# Successful requests per key, decayed over time, to find the transcripts worth
+# keeping warm. Only keys that are still cached are kept, so failing or junk
+# requests can't grow it.
+HIT_COUNTER: Counter = Counter()
+
+async def _fetch_cached(video_id, languages, translate_to, preserve_formatting):
+    key = (video_id, tuple(languages), translate_to, preserve_formatting)
+    fetched = TRANSCRIPT_CACHE.get(key)
+    if fetched is None:
+        # shielded, so one client disconnecting doesn't cancel the fetch for the others
+        fetched = await asyncio.shield(_start_load(key))
+    HIT_COUNTER[key] += 1
+    return fetched
+
+REFRESH_INTERVAL = 10
+REFRESH_AHEAD = 60
+REFRESH_TOP_N = 50
+# Refreshes running at once, so a tick finishes well within REFRESH_AHEAD
+REFRESH_CONCURRENCY = 8
+# Counts are halved this often, so a transcript stays hot across a cache lifetime
+# unless it stops being requested
+HIT_DECAY_INTERVAL = CACHE_TTL / 4
+
+def _decay_hits():
+    for key in list(HIT_COUNTER):
+        HIT_COUNTER[key] //= 2
+        if not HIT_COUNTER[key]:
+            del HIT_COUNTER[key]
+
+def _forget_evicted():
+    for state in (CACHE_EXPIRES, HIT_COUNTER):
+        for key in [key for key in state if key not in TRANSCRIPT_CACHE]:
+            del state[key]
+
+async def _refresh_due_transcripts(now):
+    keys = [
+        key
+        for key, _ in HIT_COUNTER.most_common(REFRESH_TOP_N)
+        if key in CACHE_EXPIRES
+        and CACHE_EXPIRES[key] - now <= REFRESH_AHEAD
+        and key not in INFLIGHT
+    ]
+    semaphore = asyncio.Semaphore(REFRESH_CONCURRENCY)
+
+    async def refresh(key):
+        async with semaphore:
+            await _start_load(key, refresh=True)
+
+    results = await asyncio.gather(
+        *(refresh(key) for key in keys), return_exceptions=True
+    )
+    for key, result in zip(keys, results):
+        if isinstance(result, Exception):
+            log.warning("Refreshing transcript failed for %s: %s", key, result)
+
+async def _refresh_hot_transcripts():
+    """Re-fetches the most requested transcripts shortly before their cache entries
+    expire, so their requesters keep getting cache hits."""
+    last_decay = TRANSCRIPT_CACHE.timer()
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL)
+        now = TRANSCRIPT_CACHE.timer()
+        await _refresh_due_transcripts(now)
+        if now - last_decay >= HIT_DECAY_INTERVAL:
+            _decay_hits()
+            last_decay = now
+        _forget_evicted()
+
+# The formatters below work directly on the cached snippet dicts and produce the
+# same output as the library's TextFormatter, SRTFormatter and WebVTTFormatter.
+# The one exception are times that round up to a full second, e.g. 15.999996, which
+# are printed as 00:00:16,000 instead of the library's 00:00:15,1000.
+
+def _format_timestamp(seconds, ms_separator):
+    total_ms = int(round(seconds * 1000, 2))
+    hours, rem = divmod(total_ms, 3_600_000)
+    mins, rem = divmod(rem, 60_000)
+    secs, ms = divmod(rem, 1000)
+    return f"{hours:02d}:{mins:02d}:{secs:02d}{ms_separator}{ms:03d}"
+
+def _cue_times(snippets, ms_separator):
+    """Yields the "start --> end" line of each cue. A cue ends early if the next one
+    starts before it would end."""
+    last = len(snippets) - 1
+    for i, snippet in enumerate(snippets):
+        start = snippet["start"]
+        end = start + snippet["duration"]
+        if i < last and snippets[i + 1]["start"] < end:
+            end = snippets[i + 1]["start"]
+        yield "{} --> {}".format(
+            _format_timestamp(start, ms_separator), _format_timestamp(end, ms_separator)
+        )
 
-ytt_api = YouTubeTranscriptApi()
+def _format_text(snippets):
+    return "\n".join([snippet["text"] for snippet in snippets])
+
+def _format_srt(snippets):
+    cues = [
+        f"{i}\n{times}\n{snippet['text']}"
+        for i, (times, snippet) in enumerate(zip(_cue_times(snippets, ","), snippets), 1)
+    ]
+    return "\n\n".join(cues) + "\n"
+
+def _format_webvtt(snippets):
+    cues = [
+        f"{times}\n{snippet['text']}"
+        for times, snippet in zip(_cue_times(snippets, "."), snippets)
+    ]
+    return "WEBVTT\n\n" + "\n\n".join(cues) + "\n"
+
+FORMATTERS = {"text": _format_text, "srt": _format_srt, "webvtt": _format_webvtt}
+
+def _transcript_response(video_id, fetched, fmt):
+    formatter = FORMATTERS.get(fmt)
+    if formatter is not None:
+        return {
+            "video_id": video_id,
+            "format": fmt,
+            "transcript": formatter(fetched["snippets"]),
+        }
+    return {"video_id": video_id, "transcript": fetched}
+
+def _transcript_info(fetched):
+    return {
+        "language": fetched["language"],
+        "language_code": fetched["language_code"],
+        "is_generated": fetched["is_generated"],
+    }
+
+def _columnar_response(video_id, fetched):
+    """Lays the snippets out as one array per field, so keys aren't repeated."""
+    snippets = fetched["snippets"]
+    return {
+        "video_id": video_id,
+        **_transcript_info(fetched),
+        "text": [snippet["text"] for snippet in snippets],
+        "start": [snippet["start"] for snippet in snippets],
+        "duration": [snippet["duration"] for snippet in snippets],
+    }
+
+def _stream_ndjson(video_id, fetched):
+    """Streams a header line followed by one snippet per line."""
+
+    async def lines():
+        yield orjson.dumps({"video_id": video_id, **_transcript_info(fetched)}) + b"\n"
+        for snippet in fetched["snippets"]:
+            yield orjson.dumps(snippet) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# Published transcripts don't change, so successful responses may be cached by
+# clients and CDNs. The list of transcripts of a video can still grow.
+CACHE_CONTROL = "public, max-age=86400, immutable"
+LIST_CACHE_CONTROL = "public, max-age=3600"
+
+def _etag(*parts):
+    """Weak ETag derived from everything that determines the response body. The
+    transcript that was picked is part of it, as the request's language priority
+    can resolve to a different one once YouTube adds or removes transcripts."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    return f'W/"{digest}"'
+
+def _is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (
+        tag.strip() for tag in if_none_match.split(",")
+    )
+
+def _cacheable(response: Response, etag: str) -> Response:
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    response.headers["ETag"] = etag
+    return response
+
+# Language codes as YouTube uses them, e.g. "en", "pt-BR", "zh-Hans" or "es-419"
+LANG_CODE_RE = re.compile(r"[a-zA-Z0-9-]{2,8}")
+LANG_LIST_RE = re.compile(r"\s*[a-zA-Z0-9-]{2,8}\s*(,\s*[a-zA-Z0-9-]{2,8}\s*)*")
+
+@lru_cache(maxsize=1024)
+def parse_languages(languages: str) -> Tuple[str, ...]:
+    if not LANG_LIST_RE.fullmatch(languages):
+        raise HTTPException(
+            status_code=422,
+            detail="Invalid languages. Expected comma-separated language codes, e.g. 'en,de'.",
+        )
+    return tuple(lang.strip() for lang in languages.split(","))
+
+NO_TRANSCRIPT_FOUND = (
+    "No transcript found. This video may not have subtitles or is a Shorts video."
+)
+TRANSCRIPTS_DISABLED = "Transcripts are disabled for this video."
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "healthy"}
 
 @app.get("/test/{video_id}")
-def test_transcript(video_id: str):
+async def test_transcript(video_id: str):
     try:
-        transcript_list = ytt_api.list(video_id)
+        transcript_list = await run_blocking(ytt_api.list, video_id)
         available = []
         for transcript in transcript_list:
             available.append(
@@ -36,64 +520,207 @@ def test_transcript(video_id: str):
             "available_transcripts": available,
         }
     except Exception as e:
-        import traceback
+        # the traceback only goes to the logs, the error_id is what links them up
+        error_id = uuid.uuid4().hex
+        log.exception(
+            "Listing transcripts failed error_id=%s video_id=%s", error_id, video_id
+        )
         return {
             "status": "error",
             "video_id": video_id,
             "error": str(e),
             "error_type": type(e).__name__,
-            "traceback": traceback.format_exc(),
+            "error_id": error_id,
+        }
+
+class Snippet(BaseModel):
+    text: str
+    start: float
+    duration: float
+
+class FetchedTranscriptModel(BaseModel):
+    snippets: List[Snippet]
+    video_id: str
+    language: str
+    language_code: str
+    is_generated: bool
+
+class TranscriptResponse(BaseModel):
+    video_id: str
+    transcript: FetchedTranscriptModel
+
+class FormattedTranscriptResponse(BaseModel):
+    video_id: str
+    format: str
+    transcript: str
+
+class ColumnarTranscriptResponse(BaseModel):
+    video_id: str
+    language: str
+    language_code: str
+    is_generated: bool
+    text: List[str]
+    start: List[float]
+    duration: List[float]
+
+@app.get("/list/{video_id}")
+async def list_transcripts(video_id: str):
+    try:
+        transcript_list = await run_blocking(ytt_api.list, video_id)
+    except TranscriptsDisabled:
+        raise HTTPException(status_code=403, detail=TRANSCRIPTS_DISABLED)
+    except Exception as e:
+        error_id = uuid.uuid4().hex
+        log.exception(
+            "Listing transcripts failed error_id=%s video_id=%s", error_id, video_id
+        )
+        raise HTTPException(
+            status_code=400, detail={"error": str(e), "error_id": error_id}
+        )
+
+    transcripts = [
+        {
+            "language": transcript.language,
+            "language_code": transcript.language_code,
+            "is_generated": transcript.is_generated,
+            "is_translatable": transcript.is_translatable,
         }
+        for transcript in transcript_list
+    ]
+    return ORJSONResponse(
+        {"video_id": video_id, "transcripts": transcripts},
+        headers={"Cache-Control": LIST_CACHE_CONTROL},
+    )
 
-@app.get("/transcript/{video_id}")
-def get_transcript(
+@app.get(
+    "/transcript/{video_id}",
+    response_model=Union[
+        TranscriptResponse, FormattedTranscriptResponse, ColumnarTranscriptResponse
+    ],
+)
+async def get_transcript(
+    request: Request,
     video_id: str,
     languages: Optional[str] = Query(None, description="Comma-separated codes, e.g. 'en,de'"),
     format: Optional[str] = Query("json", description="json, text, srt, webvtt"),
     translate_to: Optional[str] = Query(None, description="Translate to this language code"),
+    preserve_formatting: bool = Query(False, description="Keep select HTML text formatting"),
+    stream: bool = Query(False, description="Stream json snippets as NDJSON, one per line"),
+    columnar: bool = Query(False, description="Return json as text/start/duration arrays"),
 ):
-    lang_list = languages.split(",") if languages else ["en"]
-    lang_list = [lang.strip() for lang in lang_list]
+    lang_list = parse_languages(languages) if languages else ("en",)
 
     try:
-        transcript_list = ytt_api.list(video_id)
-        transcript = transcript_list.find_transcript(lang_list)
-
-        if translate_to:
-            transcript = transcript.translate(translate_to)
-
-        fetched = transcript.fetch()
-
+        fetched = await _fetch_cached(
+            video_id, lang_list, translate_to, preserve_formatting
+        )
         fmt = format.lower()
-        if fmt == "text":
-            formatter = TextFormatter()
-            formatted = formatter.format_transcript(fetched)
-            return {"video_id": video_id, "format": "text", "transcript": formatted}
-        elif fmt == "srt":
-            formatter = SRTFormatter()
-            formatted = formatter.format_transcript(fetched)
-            return {"video_id": video_id, "format": "srt", "transcript": formatted}
-        elif fmt == "webvtt":
-            formatter = WebVTTFormatter()
-            formatted = formatter.format_transcript(fetched)
-            return {"video_id": video_id, "format": "webvtt", "transcript": formatted}
+        if fmt in FORMATTERS:
+            body_format = fmt
+        elif stream:
+            body_format = "ndjson"
+        elif columnar:
+            body_format = "columnar"
+        else:
+            body_format = "json"
+        etag = _etag(
+            video_id,
+            lang_list,
+            translate_to,
+            preserve_formatting,
+            body_format,
+            fetched["language_code"],
+            fetched["is_generated"],
+            len(fetched["snippets"]),
+        )
+        if _is_not_modified(request, etag):
+            return _cacheable(Response(status_code=304), etag)
+        if body_format == "ndjson":
+            response = _stream_ndjson(video_id, fetched)
+        elif body_format == "columnar":
+            response = ORJSONResponse(_columnar_response(video_id, fetched))
         else:
-            return {"video_id": video_id, "transcript": fetched}
+            response = ORJSONResponse(_transcript_response(video_id, fetched, fmt))
+        return _cacheable(response, etag)
 
     except NoTranscriptFound:
-        raise HTTPException(
-            status_code=404,
-            detail="No transcript found. This video may not have subtitles or is a Shorts video.",
-        )
+        raise HTTPException(status_code=404, detail=NO_TRANSCRIPT_FOUND)
     except TranscriptsDisabled:
+        raise HTTPException(status_code=403, detail=TRANSCRIPTS_DISABLED)
+    except Exception as e:
+        error_id = uuid.uuid4().hex
+        log.exception(
+            "Fetching transcript failed error_id=%s video_id=%s", error_id, video_id
+        )
         raise HTTPException(
-            status_code=403,
-            detail="Transcripts are disabled for this video.",
+            status_code=400, detail={"error": str(e), "error_id": error_id}
         )
-    except Exception as e:
-        import traceback
-        print(f"Error fetching transcript for {video_id}: {traceback.format_exc()}")
-        raise HTTPException(status_code=400, detail=f"Error: {str(e)}")
+
+class BatchRequest(BaseModel):
+    video_ids: List[str] = Field(..., max_length=100)
+    languages: List[str] = ["en"]
+    format: str = "json"
+    translate_to: Optional[str] = None
+    preserve_formatting: bool = False
+
+    @field_validator("languages")
+    @classmethod
+    def check_languages(cls, languages: List[str]) -> List[str]:
+        for lang in languages:
+            if not LANG_CODE_RE.fullmatch(lang):
+                raise ValueError(f"invalid language code: {lang!r}")
+        return languages
+
+# Upper bound of YouTube fetches a single batch request may have in flight
+BATCH_CONCURRENCY = 16
+
+def _batch_error(video_id, error):
+    """The batch equivalent of the error responses of /transcript."""
+    result = {"video_id": video_id, "error_type": type(error).__name__}
+    if isinstance(error, NoTranscriptFound):
+        result["error"] = NO_TRANSCRIPT_FOUND
+    elif isinstance(error, TranscriptsDisabled):
+        result["error"] = TRANSCRIPTS_DISABLED
+    else:
+        result["error"] = str(error)
+        result["error_id"] = uuid.uuid4().hex
+        log.error(
+            "Fetching transcript failed error_id=%s video_id=%s",
+            result["error_id"],
+            video_id,
+            exc_info=error,
+        )
+    return result
+
+@app.post("/transcripts")
+async def get_transcripts(req: BatchRequest):
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def fetch_one(video_id):
+        async with semaphore:
+            return await _fetch_cached(
+                video_id, req.languages, req.translate_to, req.preserve_formatting
+            )
+
+    results = await asyncio.gather(
+        *(fetch_one(video_id) for video_id in req.video_ids), return_exceptions=True
+    )
+    return {
+        "transcripts": [
+            _batch_error(video_id, result)
+            if isinstance(result, BaseException)
+            else _transcript_response(video_id, result, req.format.lower())
+            for video_id, result in zip(req.video_ids, results)
+        ]
+    }
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # workers are separate processes, so pass the app as an import string
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", 8000)),
+        loop="uvloop",
+        http="httptools",
+        workers=WEB_CONCURRENCY,
+    )
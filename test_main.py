@@ -0,0 +1,687 @@
+import asyncio
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+from xml.etree.ElementTree import ParseError
+
+from fastapi.testclient import TestClient
+
+import main
+from youtube_transcript_api import (
+    NoTranscriptFound,
+    PoTokenRequired,
+    TranscriptsDisabled,
+)
+from youtube_transcript_api._transcripts import _TranscriptParser
+from youtube_transcript_api.formatters import (
+    FetchedTranscript,
+    FetchedTranscriptSnippet,
+    SRTFormatter,
+    TextFormatter,
+    WebVTTFormatter,
+)
+
+TRANSCRIPT_XML = (
+    '<?xml version="1.0" encoding="utf-8" ?><transcript>'
+    '<text start="0" dur="1.54">Hey, this is just a test</text>'
+    '<text start="1.5" dur="4.16">this is &lt;i>not&lt;/i> the original transcript</text>'
+    '<text start="5.7" dur="1.2">&amp;amp; &lt;b>bold&lt;/b></text>'
+    "</transcript>"
+)
+
+
+def _library_format(formatter, snippets):
+    transcript = FetchedTranscript(
+        snippets=[FetchedTranscriptSnippet(**snippet) for snippet in snippets],
+        video_id="12345",
+        language="English",
+        language_code="en",
+        is_generated=False,
+    )
+    return formatter.format_transcript(transcript)
+
+
+def _random_snippets(rng, count):
+    # millisecond precision, as in YouTube's transcripts
+    snippets = []
+    start = 0.0
+    for i in range(count):
+        start = round(start + rng.randint(0, 5000) / 1000, 3)
+        duration = rng.randint(0, 6000) / 1000
+        snippets.append({"text": f"line {i}", "start": start, "duration": duration})
+    return snippets
+
+
+class TestFormatters(TestCase):
+    FORMATTERS = {
+        "text": TextFormatter(),
+        "srt": SRTFormatter(),
+        "webvtt": WebVTTFormatter(),
+    }
+
+    def assert_matches_library(self, snippets):
+        for fmt, formatter in self.FORMATTERS.items():
+            with self.subTest(fmt=fmt):
+                self.assertEqual(
+                    main.FORMATTERS[fmt](snippets),
+                    _library_format(formatter, snippets),
+                )
+
+    def test_matches_library(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            self.assert_matches_library(_random_snippets(rng, rng.randint(1, 50)))
+
+    def test_empty_transcript(self):
+        self.assert_matches_library([])
+
+    def test_overlapping_cues(self):
+        snippets = [
+            {"text": "first", "start": 0.0, "duration": 5.0},
+            {"text": "second", "start": 2.5, "duration": 1.0},
+            {"text": "third", "start": 3.5, "duration": 1.0},
+        ]
+        self.assert_matches_library(snippets)
+        self.assertIn("00:00:00,000 --> 00:00:02,500", main._format_srt(snippets))
+
+    def test_rounds_up_to_full_second(self):
+        snippets = [{"text": "line", "start": 15.999996, "duration": 1.0}]
+
+        self.assertEqual(
+            main._format_srt(snippets),
+            "1\n00:00:16,000 --> 00:00:17,000\nline\n",
+        )
+        self.assertEqual(
+            main._format_webvtt(snippets),
+            "WEBVTT\n\n00:00:16.000 --> 00:00:17.000\nline\n",
+        )
+
+
+class TestParsePool(IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._workers = patch.object(main, "PARSE_WORKERS", 1)
+        cls._workers.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._workers.stop()
+
+    def setUp(self):
+        self.pool = patch.object(main, "PARSE_POOL", main._new_parse_pool())
+        self.pool.start()
+
+    def tearDown(self):
+        main.PARSE_POOL.shutdown(cancel_futures=True)
+        self.pool.stop()
+
+    async def test_parse(self):
+        for preserve_formatting in (False, True):
+            with self.subTest(preserve_formatting=preserve_formatting):
+                snippets = await main.run_in_parse_pool(
+                    main._parse_transcript_xml, TRANSCRIPT_XML, preserve_formatting
+                )
+                expected = _TranscriptParser(preserve_formatting).parse(TRANSCRIPT_XML)
+                self.assertEqual(
+                    snippets,
+                    [
+                        {"text": s.text, "start": s.start, "duration": s.duration}
+                        for s in expected
+                    ],
+                )
+
+    async def test_parse_error(self):
+        with self.assertRaises(ParseError):
+            await main.run_in_parse_pool(main._parse_transcript_xml, "<transcript", False)
+
+    async def test_rejected_xml(self):
+        with self.assertRaises(ValueError):
+            await main.run_in_parse_pool(
+                main._parse_transcript_xml,
+                '<!DOCTYPE t [<!ENTITY e "x">]><transcript>&e;</transcript>',
+                False,
+            )
+
+    async def test_recovers_from_broken_pool(self):
+        broken = main.PARSE_POOL
+        broken.submit(main.os._exit, 1)
+        # wait for the worker to die, so the next call finds the pool broken
+        while not broken._broken:
+            await asyncio.sleep(0.01)
+
+        with self.assertLogs("ytt", "WARNING"):
+            snippets = await main.run_in_parse_pool(
+                main._parse_transcript_xml, TRANSCRIPT_XML, False
+            )
+
+        self.assertEqual(len(snippets), 3)
+        self.assertIsNot(main.PARSE_POOL, broken)
+
+
+class FakeTranscript:
+    def __init__(self, video_id, language_code):
+        self.video_id = video_id
+        self.language = language_code.upper()
+        self.language_code = language_code
+        self.is_generated = False
+        self.is_translatable = True
+
+
+class FakeYouTube:
+    """Replaces the YouTube side of main, so tests never touch the network."""
+
+    def setUp(self):
+        self.available = ["en", "de"]
+        self.snippet_count = 1
+        self.find_calls = []
+        self.fetch_calls = []
+        self.patches = [
+            patch.object(main, "EXECUTOR", ThreadPoolExecutor(max_workers=4)),
+            patch.object(main, "redis_client", None),
+            patch.object(main, "_find_transcript", self.find_transcript),
+            patch.object(main, "_fetch_transcript", self.fetch_transcript),
+        ]
+        for p in self.patches:
+            p.start()
+        for state in (
+            main.TRANSCRIPT_CACHE,
+            main.RESOLVED_CACHE,
+            main.INFLIGHT,
+            main.CACHE_EXPIRES,
+            main.HIT_COUNTER,
+        ):
+            state.clear()
+
+    def tearDown(self):
+        main.EXECUTOR.shutdown()
+        for p in reversed(self.patches):
+            p.stop()
+
+    def find_transcript(self, video_id, languages, translate_to):
+        self.find_calls.append((video_id, languages))
+        for language_code in languages:
+            if language_code in self.available:
+                transcript = FakeTranscript(video_id, language_code)
+                return transcript, (language_code, False)
+        raise NoTranscriptFound(video_id, languages, None)
+
+    async def fetch_transcript(self, transcript, preserve_formatting):
+        self.fetch_calls.append((transcript.video_id, transcript.language_code))
+        await asyncio.sleep(0.05)
+        return {
+            "snippets": [
+                {"text": f"line {i}", "start": float(i), "duration": 1.0}
+                for i in range(self.snippet_count)
+            ],
+            "video_id": transcript.video_id,
+            "language": transcript.language,
+            "language_code": transcript.language_code,
+            "is_generated": transcript.is_generated,
+        }
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex):
+        self.values[key] = value
+        self.ttls[key] = ex
+
+    async def ttl(self, key):
+        return self.ttls.get(key, -2)
+
+
+class TestLoad(FakeYouTube, IsolatedAsyncioTestCase):
+    async def test_single_flight(self):
+        results = await asyncio.gather(
+            *(main._fetch_cached("12345", ["en"], None, False) for _ in range(10))
+        )
+
+        self.assertEqual(self.fetch_calls, [("12345", "en")])
+        self.assertEqual(len(self.find_calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(main.INFLIGHT, {})
+        self.assertEqual(main.HIT_COUNTER[("12345", ("en",), None, False)], 10)
+
+    async def test_cancelled_request_does_not_cancel_fetch(self):
+        first = asyncio.create_task(main._fetch_cached("12345", ["en"], None, False))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(main._fetch_cached("12345", ["en"], None, False))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        result = await second
+
+        self.assertEqual(result["language_code"], "en")
+        self.assertEqual(len(self.fetch_calls), 1)
+
+    async def test_cache_hit(self):
+        await main._fetch_cached("12345", ["en"], None, False)
+        await main._fetch_cached("12345", ["en"], None, False)
+
+        self.assertEqual(len(self.find_calls), 1)
+        self.assertEqual(len(self.fetch_calls), 1)
+
+    async def test_resolved_key_shared_across_language_priorities(self):
+        first = await main._fetch_cached("12345", ["en", "de"], None, False)
+        second = await main._fetch_cached("12345", ["fr", "en"], None, False)
+
+        # both resolve to the "en" transcript, so it is only fetched once
+        self.assertEqual(len(self.find_calls), 2)
+        self.assertEqual(self.fetch_calls, [("12345", "en")])
+        self.assertIs(first, second)
+        self.assertIn(("12345", "=en", False, None, False), main.RESOLVED_CACHE)
+        self.assertEqual(len(main.TRANSCRIPT_CACHE), 2)
+
+    async def test_single_flight_across_language_priorities(self):
+        first, second = await asyncio.gather(
+            main._fetch_cached("12345", ["en", "de"], None, False),
+            main._fetch_cached("12345", ["fr", "en"], None, False),
+        )
+
+        self.assertEqual(len(self.find_calls), 2)
+        self.assertEqual(self.fetch_calls, [("12345", "en")])
+        self.assertIs(first, second)
+        self.assertEqual(main.INFLIGHT, {})
+
+    async def test_different_transcripts_are_fetched_separately(self):
+        await main._fetch_cached("12345", ["en"], None, False)
+        await main._fetch_cached("12345", ["de"], None, False)
+        await main._fetch_cached("12345", ["en"], None, True)
+
+        self.assertEqual(
+            self.fetch_calls,
+            [("12345", "en"), ("12345", "de"), ("12345", "en")],
+        )
+
+    async def test_refresh_ignores_cache(self):
+        key = ("12345", ("en",), None, False)
+        await main._start_load(key)
+        await main._start_load(key, refresh=True)
+
+        self.assertEqual(len(self.fetch_calls), 2)
+
+    async def test_refresh_uses_fresh_shared_copy(self):
+        key = ("12345", ("en",), None, False)
+        redis = FakeRedis()
+        with patch.object(main, "redis_client", redis):
+            await main._start_load(key)
+            # another worker refreshed it a moment ago
+            await main._start_load(key, refresh=True)
+            self.assertEqual(len(self.fetch_calls), 1)
+
+            # the shared copies are about to expire as well
+            for redis_key in redis.ttls:
+                redis.ttls[redis_key] = main.REFRESH_AHEAD
+            await main._start_load(key, refresh=True)
+            self.assertEqual(len(self.fetch_calls), 2)
+            self.assertEqual(redis.ttls[main._redis_key(key)], main.CACHE_TTL)
+
+    async def test_errors_are_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(NoTranscriptFound):
+                await main._fetch_cached("12345", ["fr"], None, False)
+
+        self.assertEqual(len(self.find_calls), 2)
+        self.assertEqual(main.INFLIGHT, {})
+        self.assertEqual(main.HIT_COUNTER, {})
+
+
+class TestTranscriptEndpoint(FakeYouTube, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = TestClient(main.app)
+
+    def test_etag(self):
+        response = self.client.get("/transcript/12345")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Cache-Control"], main.CACHE_CONTROL)
+        etag = response.headers["ETag"]
+
+        response = self.client.get(
+            "/transcript/12345", headers={"If-None-Match": etag}
+        )
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(len(self.fetch_calls), 1)
+
+    def test_etag_depends_on_format(self):
+        etags = {
+            self.client.get(f"/transcript/12345?{query}").headers["ETag"]
+            for query in ("format=json", "format=srt", "columnar=true", "stream=true")
+        }
+
+        self.assertEqual(len(etags), 4)
+
+    def test_etag_changes_with_picked_transcript(self):
+        self.available = ["en"]
+        etag = self.client.get("/transcript/12345?languages=de,en").headers["ETag"]
+        self.available = ["de", "en"]
+        main.TRANSCRIPT_CACHE.clear()
+
+        response = self.client.get(
+            "/transcript/12345?languages=de,en", headers={"If-None-Match": etag}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["transcript"]["language_code"], "de")
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_stream(self):
+        self.snippet_count = 3
+
+        response = self.client.get("/transcript/12345?stream=true")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        header, *snippets = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(
+            header,
+            {
+                "video_id": "12345",
+                "language": "EN",
+                "language_code": "en",
+                "is_generated": False,
+            },
+        )
+        self.assertEqual(
+            snippets,
+            [
+                {"text": f"line {i}", "start": float(i), "duration": 1.0}
+                for i in range(3)
+            ],
+        )
+
+    def test_columnar(self):
+        self.snippet_count = 3
+
+        response = self.client.get("/transcript/12345?columnar=true")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "video_id": "12345",
+                "language": "EN",
+                "language_code": "en",
+                "is_generated": False,
+                "text": ["line 0", "line 1", "line 2"],
+                "start": [0.0, 1.0, 2.0],
+                "duration": [1.0, 1.0, 1.0],
+            },
+        )
+
+    def test_format_takes_precedence_over_columnar(self):
+        response = self.client.get("/transcript/12345?columnar=true&format=SRT")
+
+        self.assertEqual(response.json()["format"], "srt")
+        self.assertEqual(
+            response.json()["transcript"], "1\n00:00:00,000 --> 00:00:01,000\nline 0\n"
+        )
+
+    def test_gzip(self):
+        self.snippet_count = 100
+
+        response = self.client.get(
+            "/transcript/12345", headers={"Accept-Encoding": "gzip"}
+        )
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(len(response.json()["transcript"]["snippets"]), 100)
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get(
+            "/transcript/12345", headers={"Accept-Encoding": "gzip"}
+        )
+
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_errors_are_not_cacheable(self):
+        response = self.client.get("/transcript/12345?languages=fr")
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()["detail"], main.NO_TRANSCRIPT_FOUND)
+        self.assertNotIn("ETag", response.headers)
+        self.assertNotIn("Cache-Control", response.headers)
+
+
+class TestRefresh(FakeYouTube, IsolatedAsyncioTestCase):
+    async def load(self, video_id):
+        await main._fetch_cached(video_id, ["en"], None, False)
+        return (video_id, ("en",), None, False)
+
+    async def test_refreshes_due_transcripts_concurrently(self):
+        keys = [await self.load(str(i)) for i in range(main.REFRESH_CONCURRENCY)]
+        fresh = await self.load("fresh")
+        self.fetch_calls.clear()
+        now = main.CACHE_EXPIRES[keys[-1]] - main.REFRESH_AHEAD
+        main.CACHE_EXPIRES[fresh] = now + main.CACHE_TTL
+
+        started = asyncio.get_running_loop().time()
+        await main._refresh_due_transcripts(now)
+        elapsed = asyncio.get_running_loop().time() - started
+
+        self.assertCountEqual(self.fetch_calls, [(key[0], "en") for key in keys])
+        # one fake fetch takes 0.05s
+        self.assertLess(elapsed, 0.05 * len(keys) / 2)
+
+    async def test_forget_evicted(self):
+        key = await self.load("12345")
+        evicted = await self.load("evicted")
+        del main.TRANSCRIPT_CACHE[evicted]
+
+        main._forget_evicted()
+
+        self.assertEqual(list(main.HIT_COUNTER), [key])
+        self.assertEqual(list(main.CACHE_EXPIRES), [key])
+
+    async def test_failed_refreshes_are_logged(self):
+        key = await self.load("12345")
+        self.available = []
+
+        with self.assertLogs("ytt", "WARNING") as logs:
+            await main._refresh_due_transcripts(main.CACHE_EXPIRES[key])
+
+        self.assertIn("12345", logs.output[0])
+        self.assertIn(key, main.TRANSCRIPT_CACHE)
+
+
+class TestLanguages(FakeYouTube, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = TestClient(main.app)
+
+    def test_parse_languages(self):
+        self.available = ["pt-BR"]
+
+        response = self.client.get("/transcript/12345?languages=es-419, pt-BR")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.find_calls, [("12345", ("es-419", "pt-BR"))])
+
+    def test_malformed_languages(self):
+        for languages in ("en;de", "en,,de", "e", "toolongcode", ","):
+            with self.subTest(languages=languages):
+                response = self.client.get(
+                    "/transcript/12345", params={"languages": languages}
+                )
+
+                self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.find_calls, [])
+
+    def test_malformed_batch_languages(self):
+        response = self.client.post(
+            "/transcripts", json={"video_ids": ["12345"], "languages": ["en;de"]}
+        )
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.find_calls, [])
+
+
+class TestListEndpoint(FakeYouTube, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = TestClient(main.app)
+        self.list_error = None
+        self.patches.append(patch.object(main.ytt_api, "list", self.list))
+        self.patches[-1].start()
+
+    def list(self, video_id):
+        if self.list_error is not None:
+            raise self.list_error
+        return [FakeTranscript(video_id, code) for code in self.available]
+
+    def test_list(self):
+        response = self.client.get("/list/12345")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Cache-Control"], main.LIST_CACHE_CONTROL)
+        self.assertEqual(
+            response.json(),
+            {
+                "video_id": "12345",
+                "transcripts": [
+                    {
+                        "language": code.upper(),
+                        "language_code": code,
+                        "is_generated": False,
+                        "is_translatable": True,
+                    }
+                    for code in self.available
+                ],
+            },
+        )
+
+    def test_transcripts_disabled(self):
+        self.list_error = TranscriptsDisabled("12345")
+
+        response = self.client.get("/list/12345")
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()["detail"], main.TRANSCRIPTS_DISABLED)
+
+    def test_other_errors(self):
+        self.list_error = PoTokenRequired("12345")
+
+        with self.assertLogs("ytt", "ERROR") as logs:
+            response = self.client.get("/list/12345")
+
+        self.assertEqual(response.status_code, 400)
+        detail = response.json()["detail"]
+        self.assertEqual(detail["error"], str(self.list_error))
+        self.assertIn(detail["error_id"], logs.output[0])
+        self.assertNotIn("Cache-Control", response.headers)
+
+
+class TestBatchEndpoint(FakeYouTube, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = TestClient(main.app)
+
+    def test_batch(self):
+        response = self.client.post(
+            "/transcripts",
+            json={"video_ids": ["a", "b", "a"], "languages": ["de"], "format": "TEXT"},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "transcripts": [
+                    {"video_id": video_id, "format": "text", "transcript": "line 0"}
+                    for video_id in ("a", "b", "a")
+                ]
+            },
+        )
+        self.assertCountEqual(self.fetch_calls, [("a", "de"), ("b", "de")])
+
+    def test_per_item_errors(self):
+        self.available = ["en"]
+
+        response = self.client.post(
+            "/transcripts", json={"video_ids": ["12345"], "languages": ["fr"]}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["transcripts"],
+            [
+                {
+                    "video_id": "12345",
+                    "error_type": "NoTranscriptFound",
+                    "error": main.NO_TRANSCRIPT_FOUND,
+                }
+            ],
+        )
+
+    def test_too_many_video_ids(self):
+        response = self.client.post(
+            "/transcripts", json={"video_ids": [str(i) for i in range(101)]}
+        )
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.find_calls, [])
+
+
+class TestDecayHits(TestCase):
+    def setUp(self):
+        main.HIT_COUNTER.clear()
+
+    def test_decay_hits(self):
+        main.HIT_COUNTER.update({"hot": 8, "warm": 3, "cold": 1})
+
+        main._decay_hits()
+
+        self.assertEqual(main.HIT_COUNTER, {"hot": 4, "warm": 1})
+
+    def test_decay_interval_spans_cache_lifetime(self):
+        self.assertGreater(main.HIT_DECAY_INTERVAL, main.REFRESH_AHEAD)
+        self.assertLessEqual(main.HIT_DECAY_INTERVAL, main.CACHE_TTL)
+
+
+class TestBatchError(TestCase):
+    def test_no_transcript_found(self):
+        error = NoTranscriptFound("12345", ["en"], None)
+
+        self.assertEqual(
+            main._batch_error("12345", error),
+            {
+                "video_id": "12345",
+                "error_type": "NoTranscriptFound",
+                "error": main.NO_TRANSCRIPT_FOUND,
+            },
+        )
+
+    def test_transcripts_disabled(self):
+        result = main._batch_error("12345", TranscriptsDisabled("12345"))
+
+        self.assertEqual(result["error"], main.TRANSCRIPTS_DISABLED)
+        self.assertNotIn("error_id", result)
+
+    def test_other_errors_are_logged(self):
+        error = PoTokenRequired("12345")
+
+        with self.assertLogs("ytt", "ERROR") as logs:
+            result = main._batch_error("12345", error)
+
+        self.assertEqual(result["error"], str(error))
+        self.assertIn(result["error_id"], logs.output[0])
+
+
+class TestLifespan(IsolatedAsyncioTestCase):
+    async def test_reentrant(self):
+        for _ in range(2):
+            async with main.lifespan(main.app):
+                self.assertIsNotNone(main.EXECUTOR)
+                self.assertIsNotNone(main.PARSE_POOL)
+                self.assertEqual(await main.run_blocking(sum, [1, 2]), 3)